@@ -0,0 +1,12 @@
+import gc
+
+# Loads the application in the master, so that workers share its memory
+preload_app = True
+
+
+def when_ready(server):
+    from moviedatabase.warmup import warm_up
+    warm_up()
+    # Objects allocated so far are never collected, so garbage collection in
+    # the workers does not write to (and thus copy) their memory pages
+    gc.freeze()
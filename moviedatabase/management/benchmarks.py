@@ -0,0 +1,7 @@
+"""Helpers shared by the benchmark management commands and tests."""
+
+
+def percentile(sorted_values, fraction):
+    """Return the `fraction` percentile of `sorted_values`, by nearest rank."""
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(len(sorted_values) * fraction))]
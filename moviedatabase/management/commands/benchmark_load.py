@@ -0,0 +1,54 @@
+import statistics
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from django.core.management.base import BaseCommand
+
+from moviedatabase.management.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    help = ('Send concurrent GET requests to a running server and report '
+            'latency percentiles, e.g. to compare settings between runs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=8)
+
+    def _get(self, session, url):
+        started = time.perf_counter()
+        response = session.get(url)
+        return response.status_code, (time.perf_counter() - started) * 1000
+
+    def handle(self, *args, **options):
+        urls = options['urls']
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=options['concurrency'])
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(
+                lambda i: self._get(session, urls[i % len(urls)]),
+                range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        statuses = Counter(status for status, _ in results)
+        latencies = sorted(latency for _, latency in results)
+        self.stdout.write(
+            f'{len(results)} requests in {elapsed:.3f} s '
+            f'({len(results) / elapsed:.1f} requests/s)')
+        self.stdout.write(
+            'statuses: ' + ', '.join(f'{s}: {c}' for s, c in sorted(statuses.items())))
+        self.stdout.write(
+            f'latency: mean {statistics.mean(latencies):.3f} ms, '
+            f'p50 {percentile(latencies, 0.5):.3f} ms, '
+            f'p90 {percentile(latencies, 0.9):.3f} ms, '
+            f'p99 {percentile(latencies, 0.99):.3f} ms')
@@ -0,0 +1,82 @@
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Run in a fresh interpreter, so that nothing is loaded beforehand
+STARTUP_SCRIPT = '''
+import resource
+import sys
+import time
+
+started = time.perf_counter()
+from moviedatabase.wsgi import application
+if sys.argv[1] == 'warm':
+    from moviedatabase.warmup import warm_up
+    warm_up()
+print(time.perf_counter() - started,
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+SETTINGS_MODULES = ('moviedatabase.settings', 'moviedatabase.settings_api')
+
+
+def read_smaps_rollup(pid):
+    """Return memory of process `pid` in KiB, by the field of smaps_rollup."""
+    memory = {}
+    with open(f'/proc/{pid}/smaps_rollup') as smaps:
+        for line in smaps:
+            field, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                memory[field] = int(value.split()[0])
+    return memory
+
+
+class Command(BaseCommand):
+    help = ('Measure startup time and memory of a worker with each settings '
+            'module, with and without warm-up; or, with --gunicorn-pid, '
+            'memory of workers of a running gunicorn master.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--gunicorn-pid', type=int)
+
+    def _measure_startup(self, settings_module, mode, repeat):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+        durations, max_rss = [], []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, '-c', STARTUP_SCRIPT, mode],
+                cwd=settings.BASE_DIR, env=env, check=True,
+                stdout=subprocess.PIPE, universal_newlines=True,
+            ).stdout.split()
+            durations.append(float(output[0]) * 1000)
+            max_rss.append(int(output[1]))
+        self.stdout.write(
+            f'{settings_module:>30} {mode:>5}: '
+            f'startup {statistics.median(durations):8.1f} ms, '
+            f'max RSS {statistics.median(max_rss) / 1024:6.1f} MiB')
+
+    def _measure_gunicorn(self, master_pid):
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as children:
+            worker_pids = [int(pid) for pid in children.read().split()]
+        for pid in [master_pid] + worker_pids:
+            memory = read_smaps_rollup(pid)
+            private = memory['Private_Clean'] + memory['Private_Dirty']
+            self.stdout.write(
+                f'{"master" if pid == master_pid else "worker"} {pid:>7}: '
+                f'RSS {memory["Rss"] / 1024:6.1f} MiB, '
+                f'PSS {memory["Pss"] / 1024:6.1f} MiB, '
+                f'private {private / 1024:6.1f} MiB')
+
+    def handle(self, *args, **options):
+        if options['gunicorn_pid']:
+            self._measure_gunicorn(options['gunicorn_pid'])
+            return
+        for settings_module in SETTINGS_MODULES:
+            for mode in ('cold', 'warm'):
+                self._measure_startup(settings_module, mode, options['repeat'])
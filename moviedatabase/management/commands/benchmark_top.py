@@ -0,0 +1,52 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from moviedatabase.management.benchmarks import percentile
+from moviedatabase.moviedatabase import (
+    ranking,
+    views,
+)
+
+
+class Command(BaseCommand):
+    help = ('Compare latency of counting comments for /top between the SQL '
+            'path and the in-memory ranking engine, on the current database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-timestamp', type=int, default=0)
+        parser.add_argument('--end-timestamp', type=int,
+                            default=int(timezone.now().timestamp()) + 1)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def _measure(self, name, count_comments, start, end, repeat):
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            views.rank_movies(count_comments(start, end))
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        self.stdout.write(
+            f'{name:>24}: mean {statistics.mean(latencies):9.3f} ms, '
+            f'median {statistics.median(latencies):9.3f} ms, '
+            f'p99 {percentile(latencies, 0.99):9.3f} ms')
+
+    def handle(self, *args, **options):
+        start = timezone.datetime.fromtimestamp(
+            options['start_timestamp'], tz=timezone.get_current_timezone())
+        end = timezone.datetime.fromtimestamp(
+            options['end_timestamp'], tz=timezone.get_current_timezone())
+        repeat = options['repeat']
+
+        self._measure('sql', views.count_comments_in_datetime_range,
+                      start, end, repeat)
+        for mode in ranking.MODES:
+            engine = ranking.RankingEngine(mode=mode)
+            started = time.perf_counter()
+            engine.reconcile()
+            self.stdout.write(
+                f'{mode + " warm-up":>24}: '
+                f'{(time.perf_counter() - started) * 1000:9.3f} ms')
+            self._measure(mode, engine.count_comments, start, end, repeat)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from moviedatabase.moviedatabase.models import RateLimitBucket
+
+
+class Command(BaseCommand):
+    help = ('Delete rate limit buckets of clients idle for longer than the '
+            'given number of seconds. Meant to be run periodically.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-seconds', type=int, default=3600)
+
+    def handle(self, *args, **options):
+        deleted, _ = RateLimitBucket.objects.filter(
+            updated__lt=timezone.now() - timezone.timedelta(
+                seconds=options['idle_seconds']),
+        ).delete()
+        self.stdout.write(f'Deleted {deleted} buckets')
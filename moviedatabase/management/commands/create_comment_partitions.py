@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from moviedatabase.moviedatabase import partitioning
+
+
+class Command(BaseCommand):
+    help = ('Create monthly partitions of the comment table from the current '
+            'month to a number of months ahead. Meant to be run periodically.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        current_month = partitioning.month_start(timezone.now())
+        created = partitioning.create_partitions(
+            current_month,
+            partitioning.add_months(current_month, options['months_ahead']),
+        )
+        for month in created:
+            self.stdout.write(f'Created {partitioning.partition_name(month)}')
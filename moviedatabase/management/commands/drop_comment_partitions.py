@@ -0,0 +1,26 @@
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+from django.utils import timezone
+
+from moviedatabase.moviedatabase import partitioning
+
+
+class Command(BaseCommand):
+    help = ('Drop monthly partitions of the comment table, and thus all '
+            'comments, older than the given number of months.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-months', type=int, required=True,
+            help='Number of whole months to keep before the current month.')
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 0:
+            raise CommandError('--keep-months must not be negative')
+        current_month = partitioning.month_start(timezone.now())
+        dropped = partitioning.drop_partitions_before(
+            partitioning.add_months(current_month, -options['keep_months']))
+        for month in dropped:
+            self.stdout.write(f'Dropped {partitioning.partition_name(month)}')
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedatabase', '0002_comment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='added',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,132 @@
+"""Partition the comment table by month of `added`.
+
+The existing table is replaced with a partitioned one and its rows are copied
+over, so on large tables this migration takes a while and locks the comments
+for its whole duration. A primary key of a partitioned table must include the
+partition key, so it becomes (`id`, `added`); `id` stays unique, because it
+still comes from the same sequence.
+"""
+
+import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+
+# How many months of partitions to create ahead of the current month; the
+# `create_comment_partitions` management command keeps creating them later
+MONTHS_AHEAD = 3
+
+
+# Helpers of `moviedatabase.moviedatabase.partitioning` as of this migration,
+# copied so that later changes there do not change what it does. Rows are
+# copied after the partitions are created, so none are moved between them.
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    year, month_index = divmod(month.year * 12 + month.month - 1 + count, 12)
+    return datetime.date(year, month_index + 1, 1)
+
+
+def lower_bound(month):
+    return datetime.datetime(
+        month.year, month.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def create_partition(cursor, month):
+    name = f'moviedatabase_comment_y{month:%Y}m{month:%m}'
+    lower, upper = (f"'{lower_bound(bound).isoformat()}'"
+                    for bound in [month, add_months(month, 1)])
+    cursor.execute(
+        f'CREATE TABLE {name} (LIKE moviedatabase_comment '
+        f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'ALTER TABLE moviedatabase_comment ATTACH PARTITION {name} '
+        f'FOR VALUES FROM ({lower}) TO ({upper})')
+
+
+def create_partitions(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT min(added) FROM moviedatabase_comment_unpartitioned')
+        oldest, = cursor.fetchone()
+        now = timezone.now()
+        month = month_start(oldest or now)
+        while month <= add_months(month_start(now), MONTHS_AHEAD):
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedatabase', '0003_comment_added_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                'ALTER TABLE moviedatabase_comment '
+                'RENAME TO moviedatabase_comment_unpartitioned',
+                '''
+                CREATE TABLE moviedatabase_comment (
+                    id integer NOT NULL
+                        DEFAULT nextval('moviedatabase_comment_id_seq'),
+                    text text NOT NULL,
+                    added timestamp with time zone NOT NULL,
+                    movie_id_id integer NOT NULL
+                        REFERENCES moviedatabase_movie (id)
+                        DEFERRABLE INITIALLY DEFERRED,
+                    CONSTRAINT moviedatabase_comment_partitioned_pkey
+                        PRIMARY KEY (id, added)
+                ) PARTITION BY RANGE (added)
+                ''',
+                'CREATE INDEX moviedatabase_comment_partitioned_added '
+                'ON moviedatabase_comment (added)',
+                'CREATE INDEX moviedatabase_comment_partitioned_movie_id_id '
+                'ON moviedatabase_comment (movie_id_id)',
+                'CREATE TABLE moviedatabase_comment_default '
+                'PARTITION OF moviedatabase_comment DEFAULT',
+            ],
+            reverse_sql=[
+                'DROP TABLE moviedatabase_comment',
+                'ALTER TABLE moviedatabase_comment_unpartitioned '
+                'RENAME TO moviedatabase_comment',
+            ],
+        ),
+        migrations.RunPython(create_partitions, migrations.RunPython.noop),
+        migrations.RunSQL(
+            sql=[
+                'INSERT INTO moviedatabase_comment (id, text, added, movie_id_id) '
+                'SELECT id, text, added, movie_id_id '
+                'FROM moviedatabase_comment_unpartitioned',
+                'ALTER SEQUENCE moviedatabase_comment_id_seq '
+                'OWNED BY moviedatabase_comment.id',
+                'DROP TABLE moviedatabase_comment_unpartitioned',
+            ],
+            reverse_sql=[
+                '''
+                CREATE TABLE moviedatabase_comment_unpartitioned (
+                    id integer PRIMARY KEY
+                        DEFAULT nextval('moviedatabase_comment_id_seq'),
+                    text text NOT NULL,
+                    added timestamp with time zone NOT NULL,
+                    movie_id_id integer NOT NULL
+                        REFERENCES moviedatabase_movie (id)
+                        DEFERRABLE INITIALLY DEFERRED
+                )
+                ''',
+                'CREATE INDEX moviedatabase_comment_added '
+                'ON moviedatabase_comment_unpartitioned (added)',
+                'CREATE INDEX moviedatabase_comment_movie_id_id '
+                'ON moviedatabase_comment_unpartitioned (movie_id_id)',
+                'INSERT INTO moviedatabase_comment_unpartitioned '
+                '(id, text, added, movie_id_id) '
+                'SELECT id, text, added, movie_id_id FROM moviedatabase_comment',
+                'ALTER SEQUENCE moviedatabase_comment_id_seq '
+                'OWNED BY moviedatabase_comment_unpartitioned.id',
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedatabase', '0004_partition_comment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('key', models.TextField(primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('granted', models.IntegerField()),
+                ('updated', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -13,4 +13,11 @@ class Comment(models.Model):
         on_delete=models.CASCADE,
     )
     text = models.TextField()
-    added = models.DateTimeField(auto_now_add=True)
+    added = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class RateLimitBucket(models.Model):
+    key = models.TextField(primary_key=True)
+    tokens = models.FloatField()
+    granted = models.IntegerField()
+    updated = models.DateTimeField()
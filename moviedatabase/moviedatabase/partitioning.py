@@ -0,0 +1,119 @@
+"""Monthly range partitions of the comment table, by `Comment.added`.
+
+The table is partitioned natively by PostgreSQL (11 or newer), see migration
+`0004_partition_comment`. Rows outside of all monthly partitions go to the
+default partition; creating a partition moves its rows out of there.
+"""
+
+import datetime
+import re
+
+from django.db import (
+    connection as default_connection,
+    transaction,
+)
+
+
+TABLE = 'moviedatabase_comment'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+_PARTITION_NAME_RE = re.compile(rf'^{TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    year, month_index = divmod(month.year * 12 + month.month - 1 + count, 12)
+    return datetime.date(year, month_index + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_y{month:%Y}m{month:%m}'
+
+
+def lower_bound(month):
+    return datetime.datetime(
+        month.year, month.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def list_partitions(connection=default_connection):
+    """Return months of all monthly partitions, sorted."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE parent.relname = %s', [TABLE])
+        names = [name for name, in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = _PARTITION_NAME_RE.match(name)
+        if match:
+            months.append(datetime.date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def create_partition(month, connection=default_connection):
+    """Create the partition of `month`, unless it exists.
+
+    Rows of `month` already in the default partition are moved to the new one.
+    Returns whether the partition was created.
+    """
+    name = partition_name(month)
+    if month in list_partitions(connection):
+        return False
+    quote_name = connection.ops.quote_name
+    bounds = [lower_bound(month), lower_bound(add_months(month, 1))]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {quote_name(name)} '
+            f'(LIKE {quote_name(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {quote_name(DEFAULT_PARTITION)} '
+            f'WHERE added >= %s AND added < %s RETURNING *) '
+            f'INSERT INTO {quote_name(name)} SELECT * FROM moved', bounds)
+        # PostgreSQL 11 accepts only literals as partition bounds, not
+        # parameters, which psycopg2 passes with a type cast
+        lower, upper = (f"'{bound.isoformat()}'" for bound in bounds)
+        cursor.execute(
+            f'ALTER TABLE {quote_name(TABLE)} ATTACH PARTITION {quote_name(name)} '
+            f'FOR VALUES FROM ({lower}) TO ({upper})')
+    return True
+
+
+def create_partitions(start, end, connection=default_connection):
+    """Create partitions of all months from `start` to `end`, inclusive.
+
+    Returns months of the created partitions.
+    """
+    created = []
+    month = month_start(start)
+    while month <= end:
+        if create_partition(month, connection):
+            created.append(month)
+        month = add_months(month, 1)
+    return created
+
+
+def drop_partitions_before(month, connection=default_connection):
+    """Drop partitions of months before `month`.
+
+    Rows older than `month` in the default partition are deleted. Returns
+    months of the dropped partitions.
+    """
+    quote_name = connection.ops.quote_name
+    dropped = [m for m in list_partitions(connection) if m < month]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # Tables with pending deferred foreign key checks cannot be dropped
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        for dropped_month in dropped:
+            name = quote_name(partition_name(dropped_month))
+            cursor.execute(
+                f'ALTER TABLE {quote_name(TABLE)} DETACH PARTITION {name}')
+            cursor.execute(f'DROP TABLE {name}')
+        cursor.execute(
+            f'DELETE FROM {quote_name(DEFAULT_PARTITION)} WHERE added < %s',
+            [lower_bound(month)])
+    return dropped
@@ -0,0 +1,196 @@
+"""In-process PostgreSQL connection pool.
+
+Enabled by setting `ENGINE` of a database to this package. The pool is shared
+by all threads (or greenlets, with gevent workers) of a single process; every
+process, including every gunicorn worker, gets its own pool.
+
+Options are read from the `POOL` dictionary of the database settings:
+
+- `MAX_SIZE` - maximum number of connections, both idle and in use.
+- `TIMEOUT` - how many seconds to wait for a connection when all of them are
+  in use, before giving up with `OperationalError`.
+- `HEALTH_CHECK_SECONDS` - connections idle for longer than that are checked
+  with `SELECT 1` before being handed out.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    def __init__(self, max_size=10, timeout=10, health_check_seconds=30):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_seconds = health_check_seconds
+        self._condition = threading.Condition()
+        # Pairs of connection and time it was returned to the pool
+        self._idle = deque()
+        self._in_use = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+
+    def stats(self):
+        with self._condition:
+            return {
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'discarded': self._discarded,
+            }
+
+    def _checkout(self):
+        """Reserve a connection slot.
+
+        Returns an idle connection with the time it was returned to the pool,
+        or `None` if a new connection should be opened instead.
+        """
+        with self._condition:
+            if not self._idle and self._in_use >= self.max_size:
+                self._waits += 1
+                deadline = time.monotonic() + self.timeout
+                while not self._idle and self._in_use >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        logger.warning(
+                            'Timed out waiting for a database connection, '
+                            '%d in use', self._in_use)
+                        raise psycopg2.OperationalError(
+                            'connection pool exhausted')
+                    self._condition.wait(remaining)
+            self._in_use += 1
+            # Most recently used first, so that surplus connections stay idle
+            # long enough to be health checked
+            return self._idle.pop() if self._idle else None
+
+    def _is_healthy(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_seconds:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _release(self, discarded=False):
+        with self._condition:
+            self._in_use -= 1
+            if discarded:
+                self._discarded += 1
+            self._condition.notify()
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        self._release(discarded=True)
+
+    def get(self, connect):
+        """Return a healthy connection, opening one with `connect` if needed."""
+        while True:
+            idle = self._checkout()
+            if idle is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self._release()
+                    raise
+                with self._condition:
+                    self._created += 1
+                return connection
+            connection, returned_at = idle
+            if self._is_healthy(connection, returned_at):
+                return connection
+            self._discard(connection)
+
+    def put(self, connection):
+        """Return `connection` to the pool, rolling back any open transaction."""
+        if connection.closed:
+            self._release(discarded=True)
+            return
+        status = connection.get_transaction_status()
+        if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            self._discard(connection)
+            return
+        if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                self._discard(connection)
+                return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._in_use -= 1
+            self._condition.notify()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._condition:
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except psycopg2.Error:
+                pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    """Return the pool of the database `alias` for the current process.
+
+    Pools are also keyed by connection settings, because e.g. the test runner
+    changes `NAME` of an existing alias.
+    """
+    key = (os.getpid(), alias, settings_dict['NAME'], settings_dict['USER'],
+           settings_dict['HOST'], settings_dict['PORT'])
+    with _pools_lock:
+        try:
+            return _pools[key]
+        except KeyError:
+            options = settings_dict.get('POOL', {})
+            pool = _pools[key] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 10),
+                health_check_seconds=options.get('HEALTH_CHECK_SECONDS', 30),
+            )
+            return pool
+
+
+def stats():
+    """Return metrics of all pools of the current process, by database alias."""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(key[1], pool) for key, pool in _pools.items()
+                 if key[0] == pid]
+    return {alias: pool.stats() for alias, pool in pools}
+
+
+def close_all():
+    """Close idle connections of all pools of the current process."""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[0] == pid]
+    for pool in pools:
+        pool.close()
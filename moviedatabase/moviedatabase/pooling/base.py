@@ -0,0 +1,27 @@
+import time
+
+from django.db.backends.postgresql import base
+
+from . import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def connect(self):
+        super().connect()
+        # Connections persist in the pool, so the wrapper must give its one
+        # back at the end of every request, whatever `CONN_MAX_AGE` is
+        self.close_at = time.time()
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict)
+        connection = pool.get(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        # Set by `get_new_connection` of the parent only for new connections
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                get_pool(self.alias, self.settings_dict).put(self.connection)
@@ -0,0 +1,362 @@
+"""In-memory ranking engine answering /top without scanning every comment.
+
+Comment counts are kept per movie in time buckets of several sizes (a day and
+an hour). A datetime range is answered by summing the largest whole buckets
+that fit in it. In `approximate` mode the range is first widened to whole
+hours; in `consistent` mode what is left at the edges (less than an hour on
+each side) is counted in the database using the index on `Comment.added`.
+
+Every gunicorn worker holds its own engine, built from comments aggregated by
+movie and hour in the database. Comments created by the worker itself are
+counted through model signals as soon as they are committed; comments created
+by the other workers are loaded incrementally by primary key, before every
+query in `consistent` mode and at most every `TOP_RANKING_SYNC_SECONDS` in
+`approximate` mode. Primary keys skipped by a synchronization, e.g. of
+comments committed after ones with greater primary keys, are loaded as soon
+as they appear. The list of movies is reloaded on every synchronization, so
+deleted movies, with their comments, disappear from the ranking right away.
+
+The only changes not synchronized are comments deleted by other processes
+without deleting their movie, e.g. by dropping old partitions; they are
+picked up by a reconciliation with the database every
+`TOP_RANKING_RECONCILE_SECONDS`, which is run in a background thread.
+"""
+
+import logging
+import threading
+import time
+
+from collections import (
+    Counter,
+    defaultdict,
+)
+
+from django.conf import settings
+from django.db import (
+    connection,
+    transaction,
+)
+from django.db.models import (
+    Count,
+    Max,
+    Q,
+)
+from django.db.models.functions import TruncHour
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+)
+from django.utils import timezone
+
+from .models import (
+    Comment,
+    Movie,
+)
+
+
+logger = logging.getLogger(__name__)
+
+APPROXIMATE = 'approximate'
+CONSISTENT = 'consistent'
+MODES = (APPROXIMATE, CONSISTENT)
+
+# From the coarsest to the finest, in seconds; each size must be a multiple
+# of the next one
+BUCKET_SIZES = (24 * 60 * 60, 60 * 60)
+
+# How many of the greatest primary keys are checked for comments not yet
+# committed while the engine is built
+MISSING_PKS_WINDOW = 1000
+
+
+def _to_datetime(timestamp):
+    return timezone.datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+class _Buckets:
+    """Comment counts per movie in buckets of all sizes."""
+
+    def __init__(self):
+        self._levels = [defaultdict(Counter) for _ in BUCKET_SIZES]
+
+    def add(self, movie_id, added, delta=1):
+        timestamp = added.timestamp()
+        for size, buckets in zip(BUCKET_SIZES, self._levels):
+            index = int(timestamp // size)
+            counter = buckets[index]
+            counter[movie_id] += delta
+            if counter[movie_id] <= 0:
+                del counter[movie_id]
+                if not counter:
+                    del buckets[index]
+
+    def sum_whole(self, totals, start, end):
+        """Add up all whole buckets within [`start`, `end`) to `totals`.
+
+        Returns the remaining spans, each shorter than the finest bucket.
+        """
+        spans = [(start, end)]
+        for size, buckets in zip(BUCKET_SIZES, self._levels):
+            remaining = []
+            for span_start, span_end in spans:
+                first = -int(-span_start // size)
+                last = int(span_end // size)
+                if first >= last:
+                    remaining.append((span_start, span_end))
+                    continue
+                for index in range(first, last):
+                    counter = buckets.get(index)
+                    if counter:
+                        totals.update(counter)
+                remaining.append((span_start, first * size))
+                remaining.append((last * size, span_end))
+            spans = [(s, e) for s, e in remaining if s < e]
+        return spans
+
+
+class RankingEngine:
+    def __init__(self, mode=CONSISTENT, sync_interval=5, reconcile_interval=300):
+        if mode not in MODES:
+            raise ValueError(f'`mode` must be one of {MODES}, not {mode!r}')
+        self.mode = mode
+        self.sync_interval = sync_interval
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.RLock()
+        self._buckets = _Buckets()
+        self._movie_ids = set()
+        self._last_comment_pk = 0
+        # Primary keys up to `_last_comment_pk` of comments not loaded yet
+        self._missing_comment_pks = set()
+        # Comments counted through signals, but not loaded yet; they must be
+        # skipped once they are
+        self._signalled_comment_pks = set()
+        self._synced_at = None
+        self._reconciled_at = None
+        self._reconciling = False
+
+    def _build(self):
+        """Aggregate all comments in the database by movie and hour.
+
+        Returns the buckets, the greatest primary key and the primary keys
+        below it which were not committed yet.
+        """
+        buckets = _Buckets()
+        isolate = not connection.in_atomic_block
+        with transaction.atomic():
+            if isolate:
+                # All queries must see the same comments
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            last_pk = Comment.objects.aggregate(last=Max('pk'))['last'] or 0
+            rows = Comment.objects.filter(pk__lte=last_pk).annotate(
+                hour=TruncHour('added', tzinfo=timezone.utc),
+            ).values('movie_id', 'hour').annotate(total=Count('pk'))
+            for row in rows.iterator():
+                buckets.add(row['movie_id'], row['hour'], row['total'])
+            window_start = max(0, last_pk - MISSING_PKS_WINDOW)
+            present = set(Comment.objects.filter(
+                pk__gt=window_start, pk__lte=last_pk,
+            ).values_list('pk', flat=True))
+        missing = set(range(window_start + 1, last_pk + 1)) - present
+        return buckets, last_pk, missing
+
+    def reconcile(self):
+        """Rebuild all buckets from the database.
+
+        Buckets are built aside, so that queries are answered meanwhile.
+        """
+        buckets, last_pk, missing = self._build()
+        movie_ids = set(Movie.objects.values_list('pk', flat=True))
+        with self._lock:
+            self._buckets = buckets
+            self._movie_ids = movie_ids
+            self._last_comment_pk = last_pk
+            self._missing_comment_pks = missing
+            # Comments counted since the build started are loaded again
+            self._signalled_comment_pks = set()
+            self._synced_at = self._reconciled_at = time.monotonic()
+
+    def _reconcile_in_background(self):
+        try:
+            self.reconcile()
+        except Exception:
+            logger.exception('Reconciliation of the ranking engine failed')
+        finally:
+            self._reconciling = False
+            connection.close()
+
+    def sync(self):
+        """Load movies, and comments created since the last synchronization."""
+        with self._lock:
+            self._movie_ids = set(Movie.objects.values_list('pk', flat=True))
+            previous_last_pk = self._last_comment_pk
+            comments = Comment.objects.filter(
+                Q(pk__gt=previous_last_pk)
+                | Q(pk__in=self._missing_comment_pks))
+            loaded = set()
+            for pk, movie_id, added in comments.values_list(
+                    'pk', 'movie_id', 'added').iterator():
+                loaded.add(pk)
+                if pk not in self._signalled_comment_pks:
+                    self._buckets.add(movie_id, added)
+                self._last_comment_pk = max(self._last_comment_pk, pk)
+            window_start = self._last_comment_pk - MISSING_PKS_WINDOW
+            self._missing_comment_pks = {
+                pk for pk in self._missing_comment_pks.union(
+                    range(previous_last_pk + 1, self._last_comment_pk + 1))
+                if pk > window_start and pk not in loaded}
+            self._signalled_comment_pks = {
+                pk for pk in self._signalled_comment_pks
+                if pk not in loaded}
+            self._synced_at = time.monotonic()
+
+    def _refresh(self):
+        if self._reconciled_at is None:
+            self.reconcile()
+            return
+        now = time.monotonic()
+        if (now - self._reconciled_at >= self.reconcile_interval
+                and not self._reconciling):
+            self._reconciling = True
+            threading.Thread(
+                target=self._reconcile_in_background, daemon=True).start()
+        if (self.mode == CONSISTENT
+                or now - self._synced_at >= self.sync_interval):
+            self.sync()
+
+    def movie_created(self, movie):
+        with self._lock:
+            self._movie_ids.add(movie.pk)
+
+    def movie_deleted(self, movie):
+        with self._lock:
+            self._movie_ids.discard(movie.pk)
+
+    def _is_counted(self, comment):
+        return (comment.pk in self._signalled_comment_pks
+                or (comment.pk <= self._last_comment_pk
+                    and comment.pk not in self._missing_comment_pks))
+
+    def comment_created(self, comment):
+        with self._lock:
+            if self._is_counted(comment):
+                return
+            self._signalled_comment_pks.add(comment.pk)
+            self._buckets.add(comment.movie_id_id, comment.added)
+
+    def comment_deleted(self, comment):
+        with self._lock:
+            if not self._is_counted(comment):
+                return
+            self._signalled_comment_pks.discard(comment.pk)
+            self._buckets.add(comment.movie_id_id, comment.added, delta=-1)
+
+    def count_comments(self, start, end):
+        """Count comments added to each movie between `start` and `end`.
+
+        Both ends are inclusive, as in `views.get_comments_in_datetime_range`.
+        Movies without any comments in the range are included with zero.
+        """
+        totals = Counter()
+        with self._lock:
+            self._refresh()
+            movie_ids = set(self._movie_ids)
+            if end < start:
+                spans = []
+            elif self.mode == APPROXIMATE:
+                size = BUCKET_SIZES[-1]
+                self._buckets.sum_whole(
+                    totals,
+                    start.timestamp() // size * size,
+                    (end.timestamp() // size + 1) * size,
+                )
+                spans = []
+            else:
+                spans = self._buckets.sum_whole(
+                    totals, start.timestamp(), end.timestamp())
+
+        if self.mode == CONSISTENT and start <= end:
+            edges = Q(added=end)
+            for span_start, span_end in spans:
+                edges |= Q(added__gte=_to_datetime(span_start),
+                           added__lt=_to_datetime(span_end))
+            for row in Comment.objects.filter(edges).values(
+                    'movie_id').annotate(total=Count('pk')):
+                totals[row['movie_id']] += row['total']
+        return Counter({movie_id: totals[movie_id] for movie_id in movie_ids})
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the ranking engine of this process, or `None` if disabled.
+
+    The engine is created and warmed from the database on the first call.
+    """
+    global _engine
+    if not settings.TOP_RANKING_ENGINE:
+        return None
+    with _engine_lock:
+        if _engine is None:
+            engine = RankingEngine(
+                mode=settings.TOP_RANKING_ENGINE,
+                sync_interval=settings.TOP_RANKING_SYNC_SECONDS,
+                reconcile_interval=settings.TOP_RANKING_RECONCILE_SECONDS,
+            )
+            engine.reconcile()
+            _engine = engine
+            connect_signals()
+    return _engine
+
+
+def _on_commit(method, instance):
+    # Changes rolled back must not be counted; outside of a transaction
+    # `on_commit` runs the update right away
+    transaction.on_commit(lambda: method(instance))
+
+
+def _movie_saved(sender, instance, created, **kwargs):
+    if _engine is not None and created:
+        _on_commit(_engine.movie_created, instance)
+
+
+def _movie_deleted(sender, instance, **kwargs):
+    if _engine is not None:
+        _on_commit(_engine.movie_deleted, instance)
+
+
+def _comment_saved(sender, instance, created, **kwargs):
+    if _engine is not None and created:
+        _on_commit(_engine.comment_created, instance)
+
+
+def _comment_deleted(sender, instance, **kwargs):
+    if _engine is not None:
+        _on_commit(_engine.comment_deleted, instance)
+
+
+_RECEIVERS = [
+    (post_save, _movie_saved, Movie),
+    (post_delete, _movie_deleted, Movie),
+    (post_save, _comment_saved, Comment),
+    (post_delete, _comment_deleted, Comment),
+]
+
+
+def connect_signals():
+    """Keep the engine up to date with changes made by this process.
+
+    Connected only once the engine is enabled: a `post_delete` receiver of
+    `Comment` keeps Django from deleting comments of a deleted movie with a
+    single query, so it loads and deletes them one by one.
+    """
+    for signal, receiver, sender in _RECEIVERS:
+        signal.connect(receiver, sender=sender)
+
+
+def disconnect_signals():
+    for signal, receiver, sender in _RECEIVERS:
+        signal.disconnect(receiver, sender=sender)
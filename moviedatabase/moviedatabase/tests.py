@@ -1,18 +1,60 @@
+import importlib
+import json
 import random
 import string
+import threading
+import time
 
 from unittest import mock
 
+import psycopg2
+import psycopg2.extensions
+import requests
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import (
+    DatabaseError,
+    OperationalError,
+    connection,
+    connections,
+    transaction,
+)
+from django.db.models.signals import post_delete
 from django.http import Http404
-from django.test import TestCase
-from django.urls import reverse
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import (
+    Resolver404,
+    clear_url_caches,
+    resolve,
+    reverse,
+)
 from django.utils import timezone
 
-from . import views
+from moviedatabase import (
+    settings_api,
+    urls as project_urls,
+    warmup,
+)
+
+from . import (
+    partitioning,
+    pooling,
+    ranking,
+    throttling,
+    views,
+)
 from .models import (
     Comment,
     Movie,
+    RateLimitBucket,
 )
+from .pooling.base import DatabaseWrapper as PooledDatabaseWrapper
 
 
 NOT_FOUND_MOVIE_TITLE = ''.join(random.choices(
@@ -112,6 +154,14 @@ class MoviesViewTests(MovieDatabaseViewTestCase):
             reverse('movies'), {'title': NOT_FOUND_MOVIE_TITLE})
         self.assertEqual(response.status_code, 404)
 
+    def test_post_omdb_timeout(self):
+        with mock.patch.object(views.omdb_session, 'get',
+                               side_effect=requests.Timeout) as get:
+            response = self.client.post(
+                reverse('movies'), {'title': ONEWORD_MOVIE_TITLE})
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(get.call_args[1]['timeout'], settings.OMDB_TIMEOUT)
+
     def test_post_saves_to_database(self):
         self._post_movie(ONEWORD_MOVIE_TITLE)
         movie = Movie.objects.last()
@@ -361,3 +411,639 @@ class TopViewTests(MovieDatabaseViewTestCase):
                 'rank': 3,
             },
         ])
+
+    def test_limit(self):
+        _add_mock_movies(4)
+        movies = Movie.objects.all()
+        _add_mock_comments(movies[1], 4)
+        for movie in [movies[2], movies[3]]:
+            _add_mock_comments(movie, 2)
+        response = self.client.get(
+            reverse('top'), {
+                'start_timestamp': 0,
+                'end_timestamp': int(timezone.now().timestamp()) + 1,
+                'limit': 2,
+            },
+        )
+        self.assertJSONEqual(response.content, [
+            {
+                'movie_id': movies[1].pk,
+                'total_comments': 4,
+                'rank': 1,
+            },
+            {
+                'movie_id': movies[2].pk,
+                'total_comments': 2,
+                'rank': 2,
+            },
+        ])
+
+    def test_invalid_limit(self):
+        response = self.client.get(
+            reverse('top'), {
+                'start_timestamp': 0,
+                'end_timestamp': 0,
+                'limit': -1,
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_ranking_engine(self):
+        _add_mock_movies(2)
+        movies = Movie.objects.all()
+        _add_mock_comments(movies[1], 2)
+        engine = ranking.RankingEngine(mode=ranking.CONSISTENT)
+        with mock.patch.object(ranking, 'get_engine', return_value=engine):
+            response = self._get_top_movies_of_all_time()
+        self.assertJSONEqual(response.content, [
+            {
+                'movie_id': movies[1].pk,
+                'total_comments': 2,
+                'rank': 1,
+            },
+            {
+                'movie_id': movies[0].pk,
+                'total_comments': 0,
+                'rank': 2,
+            },
+        ])
+
+
+class RankingEngineTests(TestCase):
+    EPOCH = timezone.datetime.fromtimestamp(0, tz=timezone.utc)
+    HOUR = timezone.datetime(2019, 1, 1, 10, tzinfo=timezone.utc)
+
+    def setUp(self):
+        _add_mock_movies(2)
+        self.movie = Movie.objects.last()
+
+    def _add_comment(self, added, **kwargs):
+        with mock.patch('django.utils.timezone.now', mock.Mock(return_value=added)):
+            return Comment.objects.create(movie_id=self.movie, text='', **kwargs)
+
+    def _assert_same_as_database(self, engine, start, end):
+        self.assertEqual(
+            dict(engine.count_comments(start, end)),
+            dict(views.count_comments_in_datetime_range(start, end)),
+        )
+
+    def test_consistent_matches_database(self):
+        for added in [
+                self.HOUR - timezone.timedelta(days=400),
+                self.HOUR,
+                self.HOUR + timezone.timedelta(minutes=30),
+                self.HOUR + timezone.timedelta(days=2, minutes=59),
+        ]:
+            self._add_comment(added)
+        engine = ranking.RankingEngine(mode=ranking.CONSISTENT)
+        second = timezone.timedelta(seconds=1)
+        for start, end in [
+                (self.EPOCH, timezone.now()),
+                (self.HOUR, self.HOUR),
+                (self.HOUR + second, self.HOUR + timezone.timedelta(days=3)),
+                (self.HOUR - timezone.timedelta(days=500), self.HOUR - second),
+                (self.HOUR + timezone.timedelta(minutes=15),
+                 self.HOUR + timezone.timedelta(days=2, minutes=30)),
+                (self.HOUR + second, self.HOUR - second),
+        ]:
+            self._assert_same_as_database(engine, start, end)
+
+    def test_approximate_rounds_to_whole_hours(self):
+        self._add_comment(self.HOUR + timezone.timedelta(minutes=30))
+        engine = ranking.RankingEngine(mode=ranking.APPROXIMATE)
+        minute = timezone.timedelta(minutes=1)
+        self.assertEqual(
+            engine.count_comments(self.HOUR + minute, self.HOUR + minute)[
+                self.movie.pk],
+            1)
+        # Contains a whole hour and starts in the middle of the previous one
+        self.assertEqual(
+            engine.count_comments(
+                self.HOUR - 30 * minute, self.HOUR + 120 * minute)[
+                self.movie.pk],
+            1)
+
+    def test_end_before_start(self):
+        self._add_comment(self.HOUR)
+        for mode in ranking.MODES:
+            engine = ranking.RankingEngine(mode=mode)
+            self.assertEqual(
+                engine.count_comments(
+                    self.HOUR, self.HOUR - timezone.timedelta(seconds=1))[
+                    self.movie.pk],
+                0)
+
+    def test_sync_picks_up_comments_of_other_processes(self):
+        engine = ranking.RankingEngine(mode=ranking.CONSISTENT)
+        engine.reconcile()
+        # Signals are delivered only to the engine of the current process
+        _add_mock_comments(self.movie, 2)
+        self._assert_same_as_database(engine, self.EPOCH, timezone.now())
+
+    def test_sync_picks_up_comments_committed_late(self):
+        pk = self._add_comment(self.HOUR).pk
+        engine = ranking.RankingEngine(mode=ranking.CONSISTENT)
+        engine.reconcile()
+        # As if the comment with the lower primary key was committed later
+        self._add_comment(self.HOUR, pk=pk + 2)
+        self._assert_same_as_database(engine, self.EPOCH, timezone.now())
+        self._add_comment(self.HOUR, pk=pk + 1)
+        self._assert_same_as_database(engine, self.EPOCH, timezone.now())
+
+    def test_sync_drops_movies_deleted_by_other_processes(self):
+        self._add_comment(self.HOUR)
+        engine = ranking.RankingEngine(mode=ranking.CONSISTENT)
+        engine.reconcile()
+        self.movie.delete()
+        self.assertNotIn(
+            self.movie.pk, engine.count_comments(self.EPOCH, timezone.now()))
+
+    def test_signals_connected_only_when_enabled(self):
+        self.assertIsNone(ranking.get_engine())
+        self.assertFalse(post_delete.has_listeners(Comment))
+        # Comments of a deleted movie are deleted with a single query
+        _add_mock_comments(self.movie, 3)
+        with self.assertNumQueries(2):
+            self.movie.delete()
+
+
+# Signals are applied on commit, so tests must commit their transactions
+class RankingEngineSignalsTests(TransactionTestCase):
+    EPOCH = RankingEngineTests.EPOCH
+
+    def setUp(self):
+        _add_mock_movies(1)
+        self.movie = Movie.objects.last()
+        ranking.connect_signals()
+        self.addCleanup(ranking.disconnect_signals)
+
+    def _engine(self, mode):
+        engine = ranking.RankingEngine(mode=mode, sync_interval=3600)
+        engine.reconcile()
+        patcher = mock.patch.object(ranking, '_engine', engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return engine
+
+    def test_signals_are_not_counted_twice(self):
+        engine = self._engine(ranking.CONSISTENT)
+        _add_mock_comments(self.movie, 2)
+        self.assertEqual(
+            engine.count_comments(self.EPOCH, timezone.now())[self.movie.pk],
+            2)
+        Comment.objects.last().delete()
+        self.assertEqual(
+            engine.count_comments(self.EPOCH, timezone.now())[self.movie.pk],
+            1)
+
+    def test_rolled_back_comment_not_counted(self):
+        # Not synchronized, so only signals change the counts
+        engine = self._engine(ranking.APPROXIMATE)
+        with self.assertRaises(ValueError), transaction.atomic():
+            _add_mock_comments(self.movie, 1)
+            raise ValueError
+        _add_mock_comments(self.movie, 1)
+        self.assertEqual(
+            engine.count_comments(self.EPOCH, timezone.now())[self.movie.pk],
+            1)
+
+
+def _mock_connection():
+    connection = mock.MagicMock(closed=0)
+    connection.get_transaction_status.return_value = \
+        psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return connection
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def test_reuses_returned_connection(self):
+        pool = pooling.ConnectionPool(max_size=1)
+        connection = pool.get(_mock_connection)
+        pool.put(connection)
+        self.assertIs(pool.get(_mock_connection), connection)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_rolls_back_open_transaction(self):
+        pool = pooling.ConnectionPool()
+        connection = pool.get(_mock_connection)
+        connection.get_transaction_status.return_value = \
+            psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        pool.put(connection)
+        connection.rollback.assert_called_once_with()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_discards_closed_connection(self):
+        pool = pooling.ConnectionPool()
+        connection = pool.get(_mock_connection)
+        pool.put(connection)
+        connection.closed = 1
+        self.assertIsNot(pool.get(_mock_connection), connection)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    def test_health_check_of_idle_connection(self):
+        pool = pooling.ConnectionPool(health_check_seconds=0)
+        connection = pool.get(_mock_connection)
+        pool.put(connection)
+        connection.cursor.return_value.__enter__.return_value \
+            .execute.side_effect = psycopg2.OperationalError
+        self.assertIsNot(pool.get(_mock_connection), connection)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    def test_timeout_when_exhausted(self):
+        pool = pooling.ConnectionPool(max_size=1, timeout=0.01)
+        pool.get(_mock_connection)
+        self.assertRaises(psycopg2.OperationalError, pool.get, _mock_connection)
+        self.assertEqual(pool.stats()['waits'], 1)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_failed_connect_releases_slot(self):
+        pool = pooling.ConnectionPool(max_size=1)
+        connect = mock.Mock(side_effect=psycopg2.OperationalError)
+        self.assertRaises(psycopg2.OperationalError, pool.get, connect)
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+
+class PooledDatabaseWrapperTests(TransactionTestCase):
+    def setUp(self):
+        # Own alias per test, so that every test gets a new pool
+        self.alias = f'pooled_{self._testMethodName}'
+        self.settings_dict = dict(
+            connection.settings_dict,
+            ENGINE='moviedatabase.moviedatabase.pooling',
+            POOL={'MAX_SIZE': 1, 'TIMEOUT': 0.01},
+        )
+        self.pool = pooling.get_pool(self.alias, self.settings_dict)
+        self.wrappers = []
+
+    def tearDown(self):
+        for wrapper in self.wrappers:
+            wrapper.close()
+        self.pool.close()
+
+    def _connect(self):
+        wrapper = PooledDatabaseWrapper(self.settings_dict, self.alias)
+        self.wrappers.append(wrapper)
+        return wrapper
+
+    def _backend_pid(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_reuses_connection(self):
+        wrapper = self._connect()
+        backend_pid = self._backend_pid(wrapper)
+        connection = wrapper.connection
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+        self.assertFalse(connection.closed)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+        self.assertEqual(self._backend_pid(wrapper), backend_pid)
+        self.assertIs(wrapper.connection, connection)
+        self.assertEqual(self.pool.stats()['created'], 1)
+        self.assertEqual(self.pool.stats()['in_use'], 1)
+
+    def test_rolls_back_on_close(self):
+        wrapper = self._connect()
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pooled_test (id integer)')
+        wrapper.close()
+
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pg_temp.pooled_test')")
+            self.assertIsNone(cursor.fetchone()[0])
+        self.assertTrue(wrapper.get_autocommit())
+
+    def test_returns_connection_at_request_end(self):
+        self.settings_dict['CONN_MAX_AGE'] = 600
+        wrapper = self._connect()
+        self._backend_pid(wrapper)
+        with mock.patch.object(connections, 'all', return_value=[wrapper]):
+            request_finished.send(sender=self.__class__)
+        self.assertIsNone(wrapper.connection)
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+        # With a pool of one, this waits and times out unless it was returned
+        self._backend_pid(self._connect())
+
+    def test_timeout_when_exhausted(self):
+        self._backend_pid(self._connect())
+        self.assertRaises(
+            OperationalError, self._backend_pid, self._connect())
+        self.assertEqual(self.pool.stats()['timeouts'], 1)
+
+
+class PartitioningTests(TestCase):
+    MONTHS = [
+        timezone.datetime(2017, 1, 1).date(),
+        timezone.datetime(2018, 1, 1).date(),
+        timezone.datetime(2019, 1, 1).date(),
+    ]
+
+    def _add_comment(self, movie, added):
+        with mock.patch('django.utils.timezone.now', mock.Mock(return_value=added)):
+            Comment.objects.create(movie_id=movie, text='')
+
+    def _partition_count(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {name}')
+            return cursor.fetchone()[0]
+
+    def setUp(self):
+        _add_mock_movies(1)
+        self.movie = Movie.objects.last()
+        for month in self.MONTHS:
+            partitioning.create_partition(month)
+            self._add_comment(self.movie, partitioning.lower_bound(month))
+
+    def _assert_pruned(self, plan):
+        self.assertIn(partitioning.partition_name(self.MONTHS[1]), plan)
+        self.assertNotIn(partitioning.partition_name(self.MONTHS[0]), plan)
+        self.assertNotIn(partitioning.partition_name(self.MONTHS[2]), plan)
+        self.assertNotIn(partitioning.DEFAULT_PARTITION, plan)
+
+    def _month_range(self):
+        start = partitioning.lower_bound(self.MONTHS[1])
+        return start, start + timezone.timedelta(days=1)
+
+    def test_comments_in_datetime_range_pruned(self):
+        self._assert_pruned(
+            views.get_comments_in_datetime_range(*self._month_range()).explain())
+
+    def test_top_pruned(self):
+        self._assert_pruned(
+            views.get_total_comments_in_datetime_range(
+                *self._month_range()).explain())
+
+    def test_create_partition_moves_rows_from_default(self):
+        month = timezone.datetime(2016, 6, 1).date()
+        self._add_comment(self.movie, partitioning.lower_bound(month))
+        self.assertEqual(
+            self._partition_count(partitioning.DEFAULT_PARTITION), 1)
+        self.assertTrue(partitioning.create_partition(month))
+        self.assertFalse(partitioning.create_partition(month))
+        self.assertEqual(
+            self._partition_count(partitioning.DEFAULT_PARTITION), 0)
+        self.assertEqual(
+            self._partition_count(partitioning.partition_name(month)), 1)
+        self.assertEqual(Comment.objects.count(), len(self.MONTHS) + 1)
+
+    def test_drop_partitions_before(self):
+        dropped = partitioning.drop_partitions_before(self.MONTHS[1])
+        self.assertEqual(dropped, self.MONTHS[:1])
+        self.assertNotIn(self.MONTHS[0], partitioning.list_partitions())
+        self.assertEqual(Comment.objects.count(), len(self.MONTHS) - 1)
+
+
+def _mock_omdb_response(release=None, calls=None):
+    """Stub OMDb API; with `release`, requests wait for it to be set.
+
+    Every request appends an event to `calls`, set if it was released before
+    timing out.
+    """
+    def get(*args, **kwargs):
+        if release is not None:
+            released = threading.Event()
+            calls.append(released)
+            if release.wait(LoadSheddingTests.OMDB_TIMEOUT):
+                released.set()
+        return mock.Mock(content=json.dumps(
+            {'Response': 'True', 'Title': ONEWORD_MOVIE_TITLE}))
+    return mock.patch.object(views.omdb_session, 'get', side_effect=get)
+
+
+@override_settings(RATE_LIMITS={
+    throttling.MOVIES_POST: (0.001, 1, 1),
+    throttling.DEFAULT: (0.001, 2, 1),
+})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        throttling.leases.clear()
+
+    def test_default_budget(self):
+        for _ in range(2):
+            response = self.client.get(reverse('comments'))
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('comments'))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    @override_settings(RATE_LIMITS={
+        throttling.MOVIES_POST: (0.001, 1, 1),
+        throttling.DEFAULT: (0.001, 5, 3),
+    })
+    def test_lease(self):
+        def tokens():
+            return RateLimitBucket.objects.get(
+                key=f'{throttling.DEFAULT}:127.0.0.1').tokens
+
+        for _ in range(3):
+            response = self.client.get(reverse('comments'))
+            self.assertEqual(response.status_code, 200)
+            self.assertAlmostEqual(tokens(), 2, places=2)
+        for _ in range(2):
+            response = self.client.get(reverse('comments'))
+            self.assertEqual(response.status_code, 200)
+            self.assertAlmostEqual(tokens(), 0, places=2)
+        response = self.client.get(reverse('comments'))
+        self.assertEqual(response.status_code, 429)
+
+    def test_separate_budgets(self):
+        with _mock_omdb_response():
+            response = self.client.post(
+                reverse('movies'), {'title': ONEWORD_MOVIE_TITLE})
+            self.assertEqual(response.status_code, 302)
+            response = self.client.post(
+                reverse('movies'), {'title': ONEWORD_MOVIE_TITLE})
+            self.assertEqual(response.status_code, 429)
+        response = self.client.get(reverse('movies'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_separate_clients(self):
+        for address in ['192.0.2.1', '192.0.2.1', '192.0.2.2']:
+            response = self.client.get(
+                reverse('comments'), REMOTE_ADDR=address)
+            self.assertEqual(response.status_code, 200)
+
+    @override_settings(RATE_LIMIT_TRUST_X_FORWARDED_FOR=True)
+    def test_trusted_x_forwarded_for(self):
+        for address in ['192.0.2.1', '192.0.2.1', '192.0.2.2']:
+            response = self.client.get(
+                reverse('comments'),
+                HTTP_X_FORWARDED_FOR=f'198.51.100.1, {address}')
+            self.assertEqual(response.status_code, 200)
+
+    @override_settings(RATE_LIMITS={
+        throttling.MOVIES_POST: (0, 1, 1),
+        throttling.DEFAULT: (0, 1, 1),
+    })
+    def test_disabled(self):
+        for _ in range(3):
+            response = self.client.get(reverse('comments'))
+            self.assertEqual(response.status_code, 200)
+
+
+@override_settings(OMDB_MAX_CONCURRENT_REQUESTS=1)
+class OmdbRequestSlotTests(TestCase):
+    def test_no_free_slot(self):
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def hold_slot():
+            # Advisory locks are held by database sessions, so the slot must
+            # be taken through another connection, i.e. in another thread
+            try:
+                with throttling.omdb_request_slot():
+                    acquired.set()
+                    release.wait()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_slot)
+        thread.start()
+        try:
+            acquired.wait()
+            with _mock_omdb_response():
+                response = self.client.post(
+                    reverse('movies'), {'title': ONEWORD_MOVIE_TITLE})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(
+                response['Retry-After'], str(settings.OMDB_BUSY_RETRY_AFTER))
+        finally:
+            release.set()
+            thread.join()
+
+        with _mock_omdb_response():
+            response = self.client.post(
+                reverse('movies'), {'title': ONEWORD_MOVIE_TITLE})
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(
+    RATE_LIMITS={
+        throttling.MOVIES_POST: (0.001, 3, 1),
+        throttling.DEFAULT: (1000, 1000, 10),
+    },
+    OMDB_MAX_CONCURRENT_REQUESTS=2,
+)
+class LoadSheddingTests(TransactionTestCase):
+    # Requests to the stubbed OMDb API are held until all reads are done; the
+    # timeout only keeps a broken test from hanging
+    OMDB_TIMEOUT = 30
+
+    def _run(self, request, count, results):
+        client = self.client_class()
+        try:
+            for _ in range(count):
+                results.append(request(client).status_code)
+        finally:
+            connection.close()
+
+    def _start(self, threads):
+        for thread in threads:
+            thread.start()
+
+    def _join(self, threads):
+        for thread in threads:
+            thread.join()
+
+    def test_reads_unaffected_by_throttled_writes(self):
+        throttling.leases.clear()
+        writes, reads, omdb_calls = [], [], []
+        reads_done = threading.Event()
+        writers = [
+            threading.Thread(target=self._run, args=(
+                lambda client: client.post(
+                    reverse('movies'), {'title': ONEWORD_MOVIE_TITLE}),
+                5, writes))
+            for _ in range(4)
+        ]
+        readers = [
+            threading.Thread(target=self._run, args=(
+                lambda client: client.get(reverse('comments')), 25, reads))
+            for _ in range(4)
+        ]
+        with _mock_omdb_response(reads_done, omdb_calls):
+            self._start(writers)
+            try:
+                # Reads start once a write is stuck in OMDb API
+                while not omdb_calls and any(w.is_alive() for w in writers):
+                    time.sleep(0.01)
+                self._start(readers)
+                self._join(readers)
+            finally:
+                reads_done.set()
+                self._join(writers)
+
+        self.assertLessEqual(writes.count(302), 3)
+        self.assertIn(429, writes)
+        self.assertLessEqual(set(writes), {302, 429, 503})
+        self.assertEqual(set(reads), {200})
+        # Requests to OMDb API were released only after all reads finished,
+        # so no read waited for a write; reads that did would never finish
+        # and these requests would time out instead
+        self.assertTrue(omdb_calls)
+        self.assertTrue(all(released.is_set() for released in omdb_calls))
+
+
+class WarmUpTests(TransactionTestCase):
+    def setUp(self):
+        # Leaves an idle connection in a pool, which the warm-up must close
+        settings_dict = dict(
+            connection.settings_dict,
+            ENGINE='moviedatabase.moviedatabase.pooling',
+        )
+        wrapper = PooledDatabaseWrapper(settings_dict, 'warm_up')
+        wrapper.ensure_connection()
+        self.pooled_connection = wrapper.connection
+        wrapper.close()
+        self.addCleanup(pooling.close_all)
+        self.addCleanup(ranking.disconnect_signals)
+        patcher = mock.patch.object(ranking, '_engine', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _assert_nothing_open(self):
+        for database in connections.all():
+            self.assertIsNone(database.connection)
+        self.assertTrue(self.pooled_connection.closed)
+        for stats in pooling.stats().values():
+            self.assertEqual(stats['in_use'], 0)
+            self.assertEqual(stats['idle'], 0)
+
+    @override_settings(TOP_RANKING_ENGINE=ranking.CONSISTENT)
+    def test_closes_connections(self):
+        warmup.warm_up()
+        self.assertIsNotNone(ranking._engine)
+        self._assert_nothing_open()
+
+    @override_settings(TOP_RANKING_ENGINE=ranking.CONSISTENT)
+    def test_closes_connections_on_database_error(self):
+        with mock.patch.object(ranking, 'get_engine',
+                               side_effect=DatabaseError), \
+                self.assertLogs(warmup.logger, 'ERROR'):
+            warmup.warm_up()
+        self._assert_nothing_open()
+
+
+class ApiSettingsTests(TestCase):
+    def _reload_urls(self):
+        importlib.reload(project_urls)
+        clear_url_caches()
+
+    def test_admin_routed_when_installed(self):
+        self.assertEqual(resolve('/admin/').app_name, 'admin')
+
+    def test_urls_without_admin(self):
+        self.addCleanup(self._reload_urls)
+        with override_settings(INSTALLED_APPS=settings_api.INSTALLED_APPS,
+                               MIDDLEWARE=settings_api.MIDDLEWARE):
+            self._reload_urls()
+            self.assertRaises(Resolver404, resolve, '/admin/')
+            for name in ['movies', 'comments', 'top']:
+                self.assertEqual(resolve(reverse(name)).url_name, name)
+            response = self.client.get(reverse('movies'))
+            self.assertEqual(response.status_code, 200)
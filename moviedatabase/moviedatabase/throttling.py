@@ -0,0 +1,174 @@
+"""Admission control: per-client rate limits and a cap on OMDb API requests.
+
+Both are kept in the database, so they apply across all gunicorn workers.
+
+Rate limits are token buckets, one per client and budget. POST /movies, which
+calls OMDb API, has its own budget; all other requests share the default one.
+Requests over the limit get 429 Too Many Requests. Updating a bucket is a
+database write, so workers take several tokens at once (a lease) and spend
+them without touching the database.
+
+Requests to OMDb API in flight are capped by `OMDB_MAX_CONCURRENT_REQUESTS`
+PostgreSQL advisory locks; when none is free, the request gets 503 Service
+Unavailable instead of waiting.
+"""
+
+import math
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+
+from .models import RateLimitBucket
+
+
+MOVIES_POST = 'movies_post'
+DEFAULT = 'default'
+
+# First key of advisory locks of OMDb API requests; the second one is a slot
+OMDB_LOCK_CLASS = 0x6f6d6462
+
+_REFILLED = ('LEAST(%(burst)s, bucket.tokens + '
+             'EXTRACT(EPOCH FROM now() - bucket.updated) * %(rate)s)')
+_GRANTED = f'LEAST(%(count)s, FLOOR({_REFILLED}))::integer'
+
+# How long tokens taken from the database may be spent by a worker
+LEASE_SECONDS = 1
+
+
+class Throttled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'retry after {retry_after} seconds')
+        self.retry_after = retry_after
+
+
+def take_tokens(key, rate, burst, count=1):
+    """Take up to `count` tokens from the bucket of `key`.
+
+    The bucket holds at most `burst` tokens and is refilled with `rate` tokens
+    per second. Returns the number of tokens taken and, if none, seconds until
+    there is one.
+    """
+    table = connection.ops.quote_name(RateLimitBucket._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} AS bucket (key, tokens, granted, updated) '
+            f'VALUES (%(key)s, %(burst)s - LEAST(%(count)s, %(burst)s), '
+            f'LEAST(%(count)s, %(burst)s), now()) '
+            f'ON CONFLICT (key) DO UPDATE SET '
+            f'tokens = {_REFILLED} - {_GRANTED}, '
+            f'granted = {_GRANTED}, '
+            f'updated = now() '
+            f'RETURNING tokens, granted',
+            {'key': key, 'rate': rate, 'burst': burst, 'count': count},
+        )
+        tokens, granted = cursor.fetchone()
+    if granted:
+        return granted, None
+    return 0, max(1, math.ceil((1 - tokens) / rate))
+
+
+class _Leases:
+    """Tokens taken from the database, to be spent by this worker.
+
+    Taking several tokens at once saves a database write on most requests;
+    tokens not spent within `LEASE_SECONDS` are lost, so a client spread
+    across workers may get slightly fewer requests than its limit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Pairs of remaining tokens and time they expire, by bucket key
+        self._leases = {}
+
+    def take(self, key, rate, burst, lease):
+        now = time.monotonic()
+        with self._lock:
+            remaining, expires_at = self._leases.get(key, (0, now))
+            if remaining and expires_at > now:
+                self._leases[key] = remaining - 1, expires_at
+                return None
+        granted, retry_after = take_tokens(key, rate, burst, lease)
+        with self._lock:
+            if len(self._leases) > 10000:
+                self._leases = {k: v for k, v in self._leases.items()
+                                if v[1] > now}
+            if granted > 1:
+                self._leases[key] = granted - 1, now + LEASE_SECONDS
+            else:
+                self._leases.pop(key, None)
+        return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._leases.clear()
+
+
+leases = _Leases()
+
+
+def throttled_response(status, retry_after):
+    response = HttpResponse(status=status)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def get_client_address(request):
+    if settings.RATE_LIMIT_TRUST_X_FORWARDED_FOR:
+        forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded_for:
+            # The last address is the one added by the trusted proxy
+            return forwarded_for.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method == 'POST'
+                and request.resolver_match.url_name == 'movies'):
+            budget = MOVIES_POST
+        else:
+            budget = DEFAULT
+        rate, burst, lease = settings.RATE_LIMITS[budget]
+        if not rate:
+            return None
+        retry_after = leases.take(
+            f'{budget}:{get_client_address(request)}', rate, burst, lease)
+        if retry_after is not None:
+            return throttled_response(429, retry_after)
+        return None
+
+
+@contextmanager
+def omdb_request_slot():
+    """Hold one of the slots for requests to OMDb API, or raise `Throttled`."""
+    limit = settings.OMDB_MAX_CONCURRENT_REQUESTS
+    if not limit:
+        yield
+        return
+    with connection.cursor() as cursor:
+        # Random order spreads the attempts of concurrent requests
+        for slot in random.sample(range(limit), limit):
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)',
+                           [OMDB_LOCK_CLASS, slot])
+            if cursor.fetchone()[0]:
+                break
+        else:
+            raise Throttled(settings.OMDB_BUSY_RETRY_AFTER)
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)',
+                           [OMDB_LOCK_CLASS, slot])
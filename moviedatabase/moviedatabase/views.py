@@ -1,3 +1,4 @@
+import heapq
 import json
 
 from collections import Counter
@@ -6,6 +7,7 @@ import requests
 
 from django.conf import settings
 from django.core import serializers
+from django.db.models import Count
 from django.http import (
     Http404,
     HttpResponse,
@@ -18,17 +20,26 @@ from django.urls import reverse
 from django.utils import timezone
 from django.views import View
 
+from . import (
+    ranking,
+    throttling,
+)
 from .models import (
     Comment,
     Movie,
 )
 
 
+# Reuses connections to OMDb API between requests
+omdb_session = requests.Session()
+
+
 def get_details_from_external_api(title, api_key=settings.OMDB_API_KEY):
-    response = requests.get(settings.OMDB_API_URL, params={
-        'apikey': api_key,
-        't': title,
-    })
+    with throttling.omdb_request_slot():
+        response = omdb_session.get(settings.OMDB_API_URL, params={
+            'apikey': api_key,
+            't': title,
+        }, timeout=settings.OMDB_TIMEOUT)
     details = json.loads(response.content)
     if details['Response'] == 'True':
         return details
@@ -53,8 +64,13 @@ class MoviesView(View):
             title = request.POST['title']
         except KeyError:
             return HttpResponseBadRequest()
-        else:
+        try:
             details = get_details_from_external_api(title)
+        except throttling.Throttled as exc:
+            return throttling.throttled_response(503, exc.retry_after)
+        except requests.Timeout:
+            return HttpResponse(status=504)
+        else:
             movie = Movie.objects.create(title=title, details=details)
             return HttpResponseRedirect(reverse('filtered_movies', args=(movie.id,)))
 
@@ -94,36 +110,72 @@ def get_comments_in_datetime_range(start, end):
     return Comment.objects.filter(added__gte=start, added__lte=end)
 
 
+def get_total_comments_in_datetime_range(start, end):
+    # Aggregated in the database, which scans only partitions of the range
+    return get_comments_in_datetime_range(start, end).values(
+        'movie_id').annotate(total_comments=Count('pk'))
+
+
+def count_comments_in_datetime_range(start, end):
+    # Specification requires that movies without any comments must be
+    # included in the ranking
+    total_comments_by_movie_id = Counter(
+        dict.fromkeys(Movie.objects.values_list('pk', flat=True), 0))
+    for row in get_total_comments_in_datetime_range(start, end):
+        total_comments_by_movie_id[row['movie_id']] = row['total_comments']
+    return total_comments_by_movie_id
+
+
+def rank_movies(total_comments_by_movie_id, limit=None):
+    def key(item):
+        movie_id, total_comments = item
+        return -total_comments, movie_id
+
+    items = total_comments_by_movie_id.items()
+    if limit is None:
+        items = sorted(items, key=key)
+    else:
+        # Partial sort; dense ranks of the top movies depend only on the
+        # movies ranked above them
+        items = heapq.nsmallest(limit, items, key=key)
+
+    top = []
+    rank = 0
+    previous_total_comments = None
+    for movie_id, total_comments in items:
+        if total_comments != previous_total_comments:
+            rank += 1
+            previous_total_comments = total_comments
+        top.append({'movie_id': movie_id,
+                    'total_comments': total_comments,
+                    'rank': rank})
+    return top
+
+
 class TopView(View):
     def get(self, request, *args, **kwargs):
         try:
             start_timestamp = int(request.GET['start_timestamp'])
             end_timestamp = int(request.GET['end_timestamp'])
+            limit = request.GET.get('limit')
+            if limit is not None:
+                limit = int(limit)
+                if limit < 0:
+                    raise ValueError('`limit` must not be negative')
         except (KeyError, ValueError):
             return HttpResponseBadRequest()
         else:
-            comments = get_comments_in_datetime_range(
-                timezone.datetime.fromtimestamp(
-                    start_timestamp, tz=timezone.get_current_timezone()),
-                timezone.datetime.fromtimestamp(
-                    end_timestamp, tz=timezone.get_current_timezone()),
-            )
-
-            total_comments_by_movie_id = Counter()
-            for comment in comments:
-                total_comments_by_movie_id[comment.movie_id.pk] += 1
-            # Specification requires that movies without any comments must be
-            # included in the ranking
-            for movie in Movie.objects.exclude(comment__in=comments):
-                total_comments_by_movie_id[movie.pk] = 0
-
-            position_by_total_comments = {k: v for v, k in enumerate(
-                sorted(set(total_comments_by_movie_id.values()), reverse=True),
-                start=1)}
-
-            top = [{'movie_id': m,
-                    'total_comments': c,
-                    'rank': position_by_total_comments[c]}
-                   for m, c in total_comments_by_movie_id.most_common()]
-
+            start = timezone.datetime.fromtimestamp(
+                start_timestamp, tz=timezone.get_current_timezone())
+            end = timezone.datetime.fromtimestamp(
+                end_timestamp, tz=timezone.get_current_timezone())
+
+            engine = ranking.get_engine()
+            if engine is not None:
+                total_comments_by_movie_id = engine.count_comments(start, end)
+            else:
+                total_comments_by_movie_id = count_comments_in_datetime_range(
+                    start, end)
+
+            top = rank_movies(total_comments_by_movie_id, limit)
             return JsonResponse(top, safe=False)
@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'moviedatabase.moviedatabase.throttling.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'moviedatabase.urls'
@@ -129,5 +130,60 @@ STATIC_URL = '/static/'
 
 django_heroku.settings(locals())
 
+# Persistent connections and connection pooling
+# Applied after `django_heroku`, which replaces the whole default database
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get(
+    'POSTGRES_CONN_MAX_AGE', DATABASES['default'].get('CONN_MAX_AGE', 0)))
+if int(os.environ.get('POSTGRES_POOL_SIZE', '0')):
+    DATABASES['default'].update({
+        'ENGINE': 'moviedatabase.moviedatabase.pooling',
+        # Connections are kept by the pool instead, e.g. when `django_heroku`
+        # sets 600; requests must give them back when they finish
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': int(os.environ['POSTGRES_POOL_SIZE']),
+            'TIMEOUT': float(os.environ.get('POSTGRES_POOL_TIMEOUT', '10')),
+            'HEALTH_CHECK_SECONDS': float(os.environ.get(
+                'POSTGRES_POOL_HEALTH_CHECK_SECONDS', '30')),
+        },
+    })
+
 OMDB_API_URL = 'https://omdbapi.com/'
 OMDB_API_KEY = os.environ['OMDB_API_KEY']
+# Across all workers; 0 disables the limit
+OMDB_MAX_CONCURRENT_REQUESTS = int(
+    os.environ.get('OMDB_MAX_CONCURRENT_REQUESTS', '4'))
+OMDB_BUSY_RETRY_AFTER = 1
+# Seconds to wait for connecting to and for a response from OMDb API
+OMDB_TIMEOUT = (
+    float(os.environ.get('OMDB_CONNECT_TIMEOUT', '3.05')),
+    float(os.environ.get('OMDB_READ_TIMEOUT', '10')),
+)
+
+# Rate limits per client; see `moviedatabase/moviedatabase/throttling.py`
+# Requests per second, burst size and how many tokens a worker takes from the
+# database at once (see the README); rate of 0 disables the limit
+RATE_LIMITS = {
+    'movies_post': (
+        float(os.environ.get('RATE_LIMIT_MOVIES_POST_RATE', '0.2')),
+        int(os.environ.get('RATE_LIMIT_MOVIES_POST_BURST', '5')),
+        int(os.environ.get('RATE_LIMIT_MOVIES_POST_LEASE', '1')),
+    ),
+    'default': (
+        float(os.environ.get('RATE_LIMIT_DEFAULT_RATE', '20')),
+        int(os.environ.get('RATE_LIMIT_DEFAULT_BURST', '40')),
+        int(os.environ.get('RATE_LIMIT_DEFAULT_LEASE', '10')),
+    ),
+}
+# Enable only behind a proxy appending client address to X-Forwarded-For, like
+# the Heroku router; on Heroku (`DYNO` is set) it is enabled by default
+RATE_LIMIT_TRUST_X_FORWARDED_FOR = bool(strtobool(os.environ.get(
+    'RATE_LIMIT_TRUST_X_FORWARDED_FOR',
+    'true' if 'DYNO' in os.environ else 'false')))
+
+# In-memory ranking engine for /top; see `moviedatabase/moviedatabase/ranking.py`
+# Either empty (disabled), `approximate` or `consistent`
+TOP_RANKING_ENGINE = os.environ.get('TOP_RANKING_ENGINE', '')
+TOP_RANKING_SYNC_SECONDS = int(os.environ.get('TOP_RANKING_SYNC_SECONDS', '5'))
+TOP_RANKING_RECONCILE_SECONDS = int(
+    os.environ.get('TOP_RANKING_RECONCILE_SECONDS', '300'))
@@ -0,0 +1,24 @@
+"""
+Django settings for moviedatabase project, trimmed to what the API uses.
+
+Admin, sessions, messages, authentication, templates and static files are not
+used by any endpoint; leaving them out shortens startup and reduces memory of
+every worker. Enable with `DJANGO_SETTINGS_MODULE=moviedatabase.settings_api`.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+
+INSTALLED_APPS = [
+    'moviedatabase.moviedatabase.apps.MoviedatabaseConfig',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'moviedatabase.moviedatabase.throttling.RateLimitMiddleware',
+]
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
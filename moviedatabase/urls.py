@@ -13,10 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import include, path
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('moviedatabase/', include('moviedatabase.moviedatabase.urls')),
 ]
+
+# Not installed in `settings_api`
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
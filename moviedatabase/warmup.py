@@ -0,0 +1,51 @@
+"""
+Warm-up of the application before serving the first request.
+
+Meant to be run in the gunicorn master with `preload_app`, before workers are
+forked, so that everything loaded here is shared by the workers copy-on-write
+instead of being loaded again by each of them on their first request.
+"""
+
+import logging
+
+import requests
+
+from django.conf import settings
+from django.core import serializers
+from django.db import (
+    DatabaseError,
+    connections,
+)
+from django.urls import reverse
+
+from .moviedatabase import (
+    pooling,
+    ranking,
+    views,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    # Populates the URL resolver
+    reverse('movies')
+    # Serializers are loaded lazily on the first use
+    serializers.get_serializer('json')
+    # Loads modules used by `requests` only when preparing a request; nothing
+    # is sent, so no connection to OMDb API is shared with the workers
+    views.omdb_session.prepare_request(
+        requests.Request('GET', settings.OMDB_API_URL, params={'t': ''}))
+
+    try:
+        for connection in connections.all():
+            connection.ensure_connection()
+        ranking.get_engine()
+    except DatabaseError:
+        # Workers connect on their own anyway
+        logger.exception('Database warm-up failed')
+    finally:
+        # Connections must not be shared with the workers
+        connections.close_all()
+        pooling.close_all()